@@ -1,107 +1,91 @@
 import sys
+import functools
+import threading
+from array import array
 
-def makeRange(start, end):
-	out = ['(']
-	
-	for s in range(ord(start), ord(end)) :
-		out.append(chr(s))
-		out.append('|')
-		
-	out.append(end)
-	
-	return out
-
-def preProcess(expr : str) -> list:
-	#add . (NFA Concat operator)
-	#add range
-	out = []
-	i = 0
-
-	while i < len(expr) :
-		
-		if expr[i] == '[':
-					
-			start = expr[i+1]
-			end = expr[i+3]
-			
-			out += makeRange(start, end)			
-			i += 4			
-	
-		else :
-			out.append(expr[i] if expr[i] != ']' else ')')
+def invalidPattern() :
+	sys.stderr.write("Invalid regex pattern.\n")
+	sys.exit(64)
 
-			if expr[i] in {'(', '|'} :
-				i += 1; continue
-	
-			elif i < len(expr) - 1 :
-				if expr[i+1] not in {'*', '?', '+', ')', '|', ']'} :
-					out.append('.')					
-			i += 1			
+def rangeMask(start : str, end : str) -> int:
+	#bitmap with the bits of every code point from start to end set
+	return ((1 << (ord(end) - ord(start) + 1)) - 1) << ord(start)
 
-	return out
+#character classes reachable through escapes, as bitmaps of code points
 
-#operator precedence table
+DigitMask = rangeMask('0', '9')
+WordMask = rangeMask('a', 'z') | rangeMask('A', 'Z') | DigitMask | rangeMask('_', '_')
+SpaceMask = rangeMask(' ', ' ') | rangeMask('\t', '\r')
 
-Precedence = {
-	'|' : 0, #NFA Union Operator
-	'.' : 1, #NFA Concat Operator
-	'?' : 2, #NFA zero or one Operator
-	'*' : 2, #NFA Closure Operator
-	'+' : 2  #NFA one or more Operator
+Aliases = {
+	'd' : DigitMask, #\d
+	'w' : WordMask,  #\w
+	's' : SpaceMask  #\s
 }
 
-def toPosfix(expr : list) -> str:
-	
-	out, stack = [], []
+def escapeMask(char : str) -> int:
+	#\d, \w and \s are classes, any other escaped char stands for itself
+	return Aliases.get(char, 1 << ord(char))
+
+def parseClass(expr : str, i : int) -> tuple:
+	#parse the body of a [...] class starting at i,
+	#returns its bitmap and the index right after the closing ]
+	mask = 0
 	
-	for symb in expr :
-		if symb == '(' :
-			stack.append(symb)
-		
-		elif symb == ')' :
-			try :
-				while stack[-1] != '(' :
-					out.append(stack.pop())
-			except IndexError:
-				#if IndexError, then there are some missing parentheses
-				sys.stderr.write("Invalid regex pattern.\n")
-				sys.exit(64)						
-			else : 
-				stack.pop() #pop '('
-					
-		elif symb in {'+', '*', '?', '.', '|'} :
+	try :
+		while expr[i] != ']' :
+			if expr[i] == '\\' :
+				mask |= escapeMask(expr[i+1])
+				i += 2
 			
-			while len(stack) > 0 : 
-				if stack[-1] == '(' : 
-					break
-				elif Precedence[symb] > Precedence[stack[-1]] :
-					break
-				else : 
-					out.append(stack.pop())
+			elif expr[i+1] == '-' and expr[i+2] != ']' :
+				if expr[i+2] == '\\' or expr[i] > expr[i+2] :
+					#a range must run upwards between two plain chars
+					invalidPattern()
+				
+				mask |= rangeMask(expr[i], expr[i+2])
+				i += 3
 			
-			stack.append(symb)			
-		
-		else :
-			out.append(symb)
+			else :
+				mask |= 1 << ord(expr[i])
+				i += 1
 	
-	while len(stack) > 0 :
-		out.append(stack.pop())
+	except IndexError:
+		#if IndexError, then the class is never closed
+		invalidPattern()
 	
-	return "".join(out)
+	return mask, i + 1
 
 class State :
+	#a state has at most one labeled transition, as every symbol
+	#gets a fresh start state from fromSymbol, so no dict is needed for it
+	__slots__ = ('isEnd', 'symbol', 'next', 'epsilonTransitions')
+	
 	def __init__(self, isEnd : bool) :
 		self.isEnd =  isEnd
-		self.transition = {}
+		self.symbol = None
+		self.next = None
 		self.epsilonTransitions = []
 	
 	def addEpsilonTransition(self, to) :
 		self.epsilonTransitions.append(to)
 	
 	def addTransition(self, to, symbol) :
-		self.transition[symbol] = to
+		self.symbol = symbol
+		self.next = to
+
+class CharClassState(State) :
+	#state whose transition is taken on any char set in mask
+	__slots__ = ('mask',)
+	
+	def __init__(self, mask : int, to : State) :
+		super().__init__(False)
+		self.mask = mask
+		self.next = to
 
 class NFA :
+	__slots__ = ('start', 'end')
+	
 	def __init__(self, start : State, end : State) :
 		self.start = start
 		self.end = end
@@ -120,6 +104,12 @@ def fromSymbol(symbol) -> NFA:
 	
 	return NFA(start, end)
 
+def fromClass(mask : int) -> NFA:
+	end = State(True)
+	start = CharClassState(mask, end)
+	
+	return NFA(start, end)
+
 def concatenate(first : NFA, second : NFA) -> NFA:
 	first.end.addEpsilonTransition(second.start)
 	first.end.isEnd = False
@@ -176,72 +166,724 @@ def zeroOrOne(nfa : NFA) -> NFA:
 	
 	return NFA(start, end)
 
-def toNFA(posfixExpr : str) -> NFA:
-	if(posfixExpr == '') :
-		return fromEpsilon()
+class Parser :
+	#parser building the NFA while it scans the pattern, open groups are kept
+	#on an explicit stack so deep nesting costs no Python recursion
+	#
+	#	union  := concat ('|' concat)*
+	#	concat := repeat*, an empty concat matches the empty word
+	#	repeat := atom ('*' | '+' | '?')*
+	#	atom   := '(' union ')' | '[' class ']' | '\\' char | char other than '.'
+	def __init__(self, expr : str) :
+		self.expr = expr
+		self.n = len(expr)
+		self.i = 0
 	
-	stack = [] #stack of NFAs
+	def peek(self) -> str :
+		return self.expr[self.i] if self.i < self.n else ''
 	
-	try :
-		for symb in posfixExpr :
-			if symb == '*' :	
-				stack.append(closure(stack.pop()))
-			elif symb == '+' :
-				stack.append(oneOrMore(stack.pop()))
-			elif symb == '?':
-				stack.append(zeroOrOne(stack.pop()))			
-			elif symb == '|':
-				right = stack.pop()
-				left = stack.pop()
-				stack.append(union(left, right))
-			elif symb == '.' :
-				right = stack.pop()
-				left = stack.pop()
-				stack.append(concatenate(left, right))
+	def parse(self) -> NFA :
+		#alt is the union of the finished branches of the innermost group,
+		#cat the concat of its current branch, None while they are empty
+		groups = [] #(alt, cat) of every enclosing group
+		alt, cat = None, None
+		
+		while self.i < self.n :
+			c = self.expr[self.i]
+			
+			if c == '(' :
+				self.i += 1
+				groups.append((alt, cat))
+				alt, cat = None, None
+			
+			elif c == ')' :
+				if not groups :
+					#unmatched )
+					invalidPattern()
+				
+				self.i += 1
+				group = self.endUnion(alt, cat)
+				alt, cat = groups.pop()
+				cat = self.extend(cat, self.parseRepeat(group))
+			
+			elif c == '|' :
+				self.i += 1
+				alt = self.endUnion(alt, cat)
+				cat = None
+			
+			else :
+				cat = self.extend(cat, self.parseRepeat(self.parseAtom()))
+		
+		if groups :
+			#a group is never closed
+			invalidPattern()
+		
+		return self.endUnion(alt, cat)
+	
+	@staticmethod
+	def extend(cat, nfa : NFA) -> NFA :
+		return nfa if cat is None else concatenate(cat, nfa)
+	
+	@staticmethod
+	def endUnion(alt, cat) -> NFA :
+		#adds the current branch to the union, an empty one matches the empty word
+		branch = cat if cat is not None else fromEpsilon()
+		return branch if alt is None else union(alt, branch)
+	
+	def parseRepeat(self, nfa : NFA) -> NFA :
+		while True :
+			c = self.peek()
+			
+			if c == '*' :
+				nfa = closure(nfa)
+			elif c == '+' :
+				nfa = oneOrMore(nfa)
+			elif c == '?' :
+				nfa = zeroOrOne(nfa)
 			else :
-				stack.append(fromSymbol(symb))
+				return nfa
+			
+			self.i += 1
 	
-	except IndexError: 
-		#if indexError, then the NFA could not be built correctly
-		sys.stderr.write("Invalid regex pattern.\n")
-		sys.exit(64)
-	else :
-		return stack.pop()
+	def parseAtom(self) -> NFA :
+		expr = self.expr
+		c = expr[self.i]
+		self.i += 1
+		
+		#groups are opened and closed by parse
+		if c == '[' :
+			mask, self.i = parseClass(expr, self.i)
+			return fromClass(mask)
+		
+		elif c == '\\' :
+			if self.i == self.n :
+				#nothing left to escape
+				invalidPattern()
+			
+			self.i += 1
+			return fromClass(escapeMask(expr[self.i - 1]))
+		
+		elif c in {'*', '+', '?'} :
+			#nothing to repeat
+			invalidPattern()
+		
+		elif c == '.' :
+			#'.' as any char is not supported, a literal dot is written \.
+			invalidPattern()
+		
+		return fromSymbol(c)
+
+def parse(expr : str) -> NFA:
+	return Parser(expr).parse()
 
-def setNextState(state : State, nextStates : list, visited : list) :
+class FlatNFA :
+	#the NFA laid out as parallel arrays indexed by state id (0 is the start),
+	#each state has at most one labeled transition, either a symbol or a class
+	def __init__(self, nfa : NFA) :
+		states = [nfa.start]
+		ids = {nfa.start : 0}
+		
+		for state in states : #BFS, states grows while it is walked
+			targets = list(state.epsilonTransitions)
+			
+			if state.next is not None :
+				targets.append(state.next)
+			
+			for stt in targets :
+				if stt not in ids :
+					ids[stt] = len(states)
+					states.append(stt)
+		
+		n = len(states)
+		self.numStates = n
+		self.accept = bytearray(state.isEnd for state in states)
+		self.transSym = array('i', [-1]) * n #ord of the symbol, -1 if none
+		self.transMask = [0] * n #class bitmap, 0 if none
+		self.transTgt = array('i', [-1]) * n
+		self.epsOffsets = array('i', [0]) #epsilon targets of i are
+		self.epsTargets = array('i')      #epsTargets[epsOffsets[i]:epsOffsets[i+1]]
+		
+		for sid, state in enumerate(states) :
+			if isinstance(state, CharClassState) :
+				self.transMask[sid] = state.mask
+				self.transTgt[sid] = ids[state.next]
+			
+			elif state.symbol is not None :
+				self.transSym[sid] = ord(state.symbol)
+				self.transTgt[sid] = ids[state.next]
+			
+			self.epsTargets.extend(ids[stt] for stt in state.epsilonTransitions)
+			self.epsOffsets.append(len(self.epsTargets))
+		
+		#epsClosure[i] is the closure of state i, filled once since the NFA never changes
+		self.epsClosure = self.walkClosures()
+		self.initial = self.epsClosure[0]
+		self.acceptStates = frozenset(sid for sid in range(n) if self.accept[sid])
+	
+	def walkClosures(self) -> list :
+		#states reachable from each state through epsilon transitions, only the
+		#ones without epsilon transitions of their own are kept, by an iterative
+		#Tarjan walk over the epsilon edges, it finishes a strongly connected
+		#component only after every component it reaches, so a closure is the
+		#union of the finished closures of its successors, the loops built by
+		#closure and oneOrMore are single components sharing one closure
+		n = self.numStates
+		epsOffsets, epsTargets = self.epsOffsets, self.epsTargets
+		closures = [None] * n
+		index = [-1] * n #visit order, -1 until visited
+		low = [0] * n    #lowest index reachable without leaving the stack
+		onStack = bytearray(n)
+		stack = []
+		count = 0
+		
+		for root in range(n) :
+			if index[root] >= 0 :
+				continue
+			
+			index[root] = low[root] = count
+			count += 1
+			stack.append(root)
+			onStack[root] = 1
+			work = [[root, epsOffsets[root]]] #state and position of its next edge
+			
+			while work :
+				frame = work[-1]
+				sid, pos = frame
+				
+				if pos < epsOffsets[sid+1] :
+					frame[1] += 1
+					nxt = epsTargets[pos]
+					
+					if index[nxt] < 0 :
+						index[nxt] = low[nxt] = count
+						count += 1
+						stack.append(nxt)
+						onStack[nxt] = 1
+						work.append([nxt, epsOffsets[nxt]])
+					
+					elif onStack[nxt] and index[nxt] < low[sid] :
+						low[sid] = index[nxt]
+					
+					continue
+				
+				work.pop()
+				
+				if work and low[sid] < low[work[-1][0]] :
+					low[work[-1][0]] = low[sid]
+				
+				if low[sid] != index[sid] :
+					continue
+				
+				#sid roots a component, its members are on top of the stack
+				members = []
+				
+				while True :
+					stt = stack.pop()
+					onStack[stt] = 0
+					members.append(stt)
+					
+					if stt == sid :
+						break
+				
+				first, last = epsOffsets[sid], epsOffsets[sid+1]
+				
+				if len(members) == 1 and last - first == 1 and epsTargets[first] != sid :
+					#a plain epsilon link shares the closure of its target
+					closures[sid] = closures[epsTargets[first]]
+					continue
+				
+				out = set()
+				
+				for stt in members :
+					first, last = epsOffsets[stt], epsOffsets[stt+1]
+					
+					if first == last :
+						out.add(stt)
+					
+					for nxt in epsTargets[first:last] :
+						#members are still None, every other target is finished
+						if closures[nxt] is not None :
+							out |= closures[nxt]
+				
+				closure = frozenset(out)
+				
+				for stt in members :
+					closures[stt] = closure
+		
+		return closures
+	
+	def literal(self, sid : int) -> int :
+		#ord of the only char state sid accepts, -1 if there is not just one,
+		#escaped operators are single char classes so they count too
+		mask = self.transMask[sid]
+		
+		if mask and mask & (mask - 1) == 0 :
+			return mask.bit_length() - 1
+		
+		return self.transSym[sid]
+	
+	def literalPrefix(self) -> str :
+		#longest string every match has to start with, found by following
+		#the start while its closure is a single state with a literal transition
+		prefix = []
+		current = self.initial
+		seen = set()
+		
+		while len(current) == 1 and current not in seen :
+			seen.add(current)
+			sid, = current
+			
+			if self.accept[sid] or self.literal(sid) < 0 :
+				break
+			
+			prefix.append(chr(self.literal(sid)))
+			current = self.epsClosure[self.transTgt[sid]]
+		
+		return "".join(prefix)
+	
+	def alphabet(self) -> int :
+		#bitmap of every char some transition accepts
+		mask = 0
+		
+		for sym, classMask in zip(self.transSym, self.transMask) :
+			mask |= classMask
+			
+			if sym >= 0 :
+				mask |= 1 << sym
+		
+		return mask
 	
-	if len(state.epsilonTransitions) > 0 :
-		for stt in state.epsilonTransitions:
-			if not stt in visited :
-				visited.append(stt)
-				setNextState(stt, nextStates, visited)
-	else :
-		nextStates.append(state)
+	def byteClasses(self) -> tuple :
+		#split the 256 latin-1 chars into classes no transition tells apart,
+		#returns the class of every byte and the first byte of each class
+		sigs = [0] * 256 #byte -> states with a transition on it
+		
+		for sid, (sym, classMask) in enumerate(zip(self.transSym, self.transMask)) :
+			mask = classMask & Latin1Mask
+			
+			if 0 <= sym < 256 :
+				mask |= 1 << sym
+			
+			while mask :
+				low = mask & -mask
+				sigs[low.bit_length() - 1] |= 1 << sid
+				mask ^= low
+		
+		ids = {}
+		classes = bytes(ids.setdefault(sig, len(ids)) for sig in sigs)
+		firsts = {}
+		
+		for byte, cls in enumerate(classes) :
+			firsts.setdefault(cls, byte)
+		
+		return classes, list(firsts.values())
+	
+	def literalSuffix(self) -> str :
+		#longest string every match has to end with, found by walking back
+		#from the accepting state while all the last transitions are one literal
+		suffix = []
+		current = self.acceptStates
+		seen = set()
+		
+		if not self.initial.isdisjoint(current) :
+			#the empty word matches, so no char is required
+			return ""
+		
+		#landedFrom[i] lists the labeled states whose transition target has i in its closure
+		landedFrom = [[] for _ in range(self.numStates)]
+		literals = {}
+		
+		for sid, tgt in enumerate(self.transTgt) :
+			if tgt >= 0 :
+				literals[sid] = self.literal(sid)
+				
+				for stt in self.epsClosure[tgt] :
+					landedFrom[stt].append(sid)
+		
+		while self.initial.isdisjoint(current) and current not in seen :
+			seen.add(current)
+			#states whose transition lands in the closure of a state in current
+			last = frozenset(sid for stt in current for sid in landedFrom[stt])
+			codes = {literals[sid] for sid in last}
+			
+			if len(codes) != 1 or -1 in codes :
+				break
+			
+			suffix.append(chr(codes.pop()))
+			current = last
+		
+		return "".join(reversed(suffix))
+
+class BitNFA :
+	#bit-parallel simulation of a FlatNFA, a set of states is an int
+	#with bit i set when state i is active, Python ints grow past 64 bits
+	#so this holds for NFAs of any size
+	def __init__(self, nfa : FlatNFA) :
+		self.nfa = nfa
+		self.initial = self.toBits(nfa.initial)
+		self.acceptBits = self.toBits(i for i in range(nfa.numStates) if nfa.accept[i])
+		#follow[i] is the closure of the target of state i's labeled transition
+		self.follow = [
+			self.toBits(nfa.epsClosure[tgt]) if tgt >= 0 else 0 for tgt in nfa.transTgt
+		]
+		self.charBits = {} #ord of a symbol -> states with a transition on it
+	
+	@staticmethod
+	def toBits(states) -> int :
+		bits = 0
+		
+		for sid in states :
+			bits |= 1 << sid
+		
+		return bits
+	
+	def symbolBits(self, code : int) -> int :
+		nfa = self.nfa
+		
+		bits = self.toBits(
+			sid for sid, (sym, mask) in enumerate(zip(nfa.transSym, nfa.transMask))
+			if sym == code or (mask >> code) & 1
+		)
+		
+		self.charBits[code] = bits
+		return bits
+	
+	def move(self, active : int, code : int) -> int :
+		bits = self.charBits.get(code)
+		
+		if bits is None :
+			bits = self.symbolBits(code)
+		
+		follow = self.follow
+		active &= bits
+		out = 0
+		
+		while active :
+			low = active & -active
+			out |= follow[low.bit_length() - 1]
+			active ^= low
+		
+		return out
+	
+	def isAccepting(self, active : int) -> bool :
+		return active & self.acceptBits != 0
+
+def toCodes(word : str) :
+	#the word as a sequence of char ords, bytes yield them without
+	#building a one char str per step, other words go through ord
+	try :
+		return word.encode('latin-1')
+	except UnicodeEncodeError:
+		return map(ord, word)
 
 def search(nfa : NFA, word : str) -> bool :
-	current = []
-	setNextState(nfa.start, current, [])
+	#match word against nfa without building a DFA, by stepping
+	#the set of active states over each symbol
+	sim = BitNFA(FlatNFA(nfa))
+	current = sim.initial
+	
+	for code in toCodes(word) :
+		current = sim.move(current, code)
+		
+		if not current :
+			return False
+	
+	return sim.isAccepting(current)
+
+#largest DFA built in full ahead of time
+
+MaxTableStates = 1024
+
+#bytes TableDFA.match walks between checks for the dead state
+
+DeadCheckBlock = 256
+
+Latin1Mask = (1 << 256) - 1
+
+class TableDFA :
+	#DFA built in full over latin-1, trans[state] is a tuple of
+	#the 256 next states indexed by byte, tuples hand back the ids already
+	#boxed where an array would build a new int object at every step
+	def __init__(self, trans : list, accept : bytearray, dead : int) :
+		self.trans = trans
+		self.accept = accept
+		self.dead = dead #the state no word leaves, -1 if unreachable
+		self.start = 0
+	
+	def match(self, data : bytes) -> bool :
+		#the dead state is checked once per block, so the loop keeps one load
+		#per byte while a failed word stops within a block of where it failed
+		trans, dead = self.trans, self.dead
+		sid = self.start
+		
+		for i in range(0, len(data), DeadCheckBlock) :
+			for byte in data[i:i + DeadCheckBlock] :
+				sid = trans[sid][byte]
+			
+			if sid == dead :
+				return False
+		
+		return self.accept[sid] == 1
+
+def minimizeDFA(rows : list, accept : bytearray, dead : int) -> tuple :
+	#Hopcroft's partition refinement, rows[s][c] is the next state of s on
+	#byte class c, returns the rows, accept and dead state of the minimal
+	#DFA, renumbered so the start state 0 keeps its id
+	n, k = len(rows), len(rows[0])
+	inverse = [[[] for _ in range(n)] for _ in range(k)] #inverse[c][t] -> states going to t on c
+	
+	for s, row in enumerate(rows) :
+		for c, t in enumerate(row) :
+			inverse[c][t].append(s)
+	
+	accepting = frozenset(s for s in range(n) if accept[s])
+	partition = [block for block in (accepting, frozenset(range(n)) - accepting) if block]
+	work = [min(partition, key = len)]
+	
+	while work :
+		splitter = work.pop()
+		
+		for c in range(k) :
+			#states with a transition on c into the splitter
+			x = {s for t in splitter for s in inverse[c][t]}
+			
+			if not x :
+				continue
+			
+			refined = []
+			
+			for block in partition :
+				inside = block & x
+				
+				if not inside or len(inside) == len(block) :
+					refined.append(block); continue
+				
+				outside = block - inside
+				refined += [inside, outside]
+				
+				if block in work :
+					work.remove(block)
+					work += [inside, outside]
+				else :
+					work.append(min(inside, outside, key = len))
+			
+			partition = refined
+	
+	#the block holding the start state becomes state 0
+	partition.sort(key = lambda block : 0 not in block)
+	blockOf = [0] * n
+	
+	for b, block in enumerate(partition) :
+		for s in block :
+			blockOf[s] = b
+	
+	minRows = [[blockOf[t] for t in rows[next(iter(block))]] for block in partition]
+	minAccept = bytearray(accept[next(iter(block))] for block in partition)
+	
+	return minRows, minAccept, blockOf[dead] if dead >= 0 else -1
+
+def buildDFA(nfa, flat : FlatNFA, maxStates : int = MaxTableStates) :
+	#subset construction of the whole DFA, nfa is the BitNFA simulating
+	#flat, returns None once it grows past maxStates
+	if flat.numStates > maxStates :
+		#the DFA of an NFA this large is almost never small enough,
+		#so the construction is not even started
+		return None
+	
+	classes, firsts = flat.byteClasses()
+	keys = [nfa.initial]
+	ids = {nfa.initial : 0}
+	rows = [] #rows[s][c] is the next state of s on byte class c
 	
-	for symbol in word :
-		nextStates = []
+	for key in keys : #worklist, keys grows while it is walked
+		if len(keys) > maxStates :
+			return None
+		
+		row = []
 		
-		for state in current :
-			if symbol in state.transition:
-				setNextState(state.transition[symbol], nextStates, [])
+		for byte in firsts :
+			nxt = nfa.move(key, byte)
+			
+			if nxt not in ids :
+				ids[nxt] = len(keys)
+				keys.append(nxt)
+			
+			row.append(ids[nxt])
 		
-		current = nextStates
+		rows.append(row)
+	
+	#the empty set of NFA states is the dead state
+	dead = -1
 	
-	for state in current:
-		if state.isEnd :
-			return True
+	for sid, key in enumerate(keys) :
+		if not key :
+			dead = sid
 	
-	return False
+	accept = bytearray(nfa.isAccepting(key) for key in keys)
+	rows, accept, dead = minimizeDFA(rows, accept, dead)
+	trans = [tuple([row[cls] for cls in classes]) for row in rows]
+	
+	return TableDFA(trans, accept, dead)
+
+#maximum number of DFA states kept by a LazyDFA before its cache is flushed
+
+MaxCachedStates = 4096
 
+class LazyDFA :
+	#DFA built on demand from the NFA by subset construction,
+	#each DFA state is the set of NFA states it stands for, as a bitmask
+	#from the BitNFA it is built on
+	def __init__(self, nfa, maxStates : int = MaxCachedStates) :
+		self.nfa = nfa
+		self.maxStates = maxStates
+		#misses are built under the lock, so a shared Regex can match from many threads
+		self.lock = threading.Lock()
+		self.flush()
+	
+	def flush(self) :
+		#a fresh cache replaces the old one instead of clearing it, threads
+		#still walking the old cache keep consistent state ids until their next miss
+		self.statesByKey = {} #set of NFA states -> state id
+		#(delta, accept, keys) read as one attribute, delta is state id ->
+		#{ord of a symbol : state id}, accept the ids of the accepting states
+		#and keys state id -> set of NFA states
+		self.cache = ([], set(), [])
+		self.addState(self.nfa.initial) #the start state, always id 0
+	
+	def addState(self, key) -> int :
+		sid = self.statesByKey.get(key)
+		
+		if sid is None :
+			delta, accept, keys = self.cache
+			sid = len(keys)
+			self.statesByKey[key] = sid
+			keys.append(key)
+			delta.append({})
+			
+			if self.nfa.isAccepting(key) :
+				accept.add(sid)
+		
+		return sid
+	
+	def nextState(self, cache : tuple, sid : int, code : int) -> tuple :
+		#the step from state sid of cache on code, returns the cache the
+		#next state id belongs to along with it, -1 if the word cannot match
+		with self.lock :
+			key = cache[2][sid]
+			
+			if len(self.cache[2]) >= self.maxStates :
+				#the cache is full, start over as RE2 does
+				self.flush()
+			
+			if cache is not self.cache :
+				#flushed since the caller read it, its state is moved to the current one
+				cache = self.cache
+				sid = self.addState(key)
+			
+			nxtKey = self.nfa.move(key, code)
+			
+			if not nxtKey :
+				#no NFA state is left, the word can no longer match, this is
+				#left out of delta so match only tests for it on a miss
+				return cache, -1
+			
+			nxt = self.addState(nxtKey)
+			cache[0][sid][code] = nxt
+			
+			return cache, nxt
+	
+	def match(self, codes) -> bool :
+		#codes is the word as char ords, as given by toCodes,
+		#the hot loop, one list index and one dict probe per symbol
+		cache = self.cache
+		delta = cache[0]
+		sid = 0
+		
+		for code in codes :
+			nxt = delta[sid].get(code)
+			
+			if nxt is None :
+				cache, nxt = self.nextState(cache, sid, code)
+				
+				if nxt < 0 :
+					return False
+				
+				delta = cache[0]
+			
+			sid = nxt
+		
+		return sid in cache[1]
+	
 class Regex :
-	def __init__(self, expr : str) :
-		expr = toPosfix(preProcess(expr))
-		self.nfa = toNFA(expr)
+	def __new__(cls, expr : str, cache : bool = False) :
+		#Regex(expr, cache = True) hands back the shared instance from compile
+		if cache :
+			return compile(expr)
+		
+		return super().__new__(cls)
+	
+	def __init__(self, expr : str, cache : bool = False) :
+		if cache :
+			return #already built by compile
+		
+		self.pattern = expr
+		self.nfa = parse(expr)
+		self.flat = FlatNFA(self.nfa)
+		self.prefix = self.flat.literalPrefix()
+		self.suffix = self.flat.literalSuffix()
+		
+		#latin-1 chars some transition accepts, a word holding any other cannot match
+		alphabet = self.flat.alphabet()
+		self.alphabet = bytes(c for c in range(256) if (alphabet >> c) & 1)
+		
+		sim = BitNFA(self.flat)
+		
+		#small DFAs are built in full for latin-1 words, the lazy one
+		#covers larger DFAs and words outside latin-1
+		self.table = buildDFA(sim, self.flat)
+		self.dfa = LazyDFA(sim)
+	
+	#a Regex is fully determined by its pattern, so equal patterns compare
+	#and hash alike, cached or not, as re.Pattern objects do
+	def __eq__(self, other) :
+		if not isinstance(other, Regex) :
+			return NotImplemented
+		
+		return self.pattern == other.pattern
+	
+	def __hash__(self) :
+		return hash(self.pattern)
+
+	#copies and pickles are rebuilt from the pattern, as re.Pattern objects are
+	def __reduce__(self) :
+		return Regex, (self.pattern,)
 	
 	def match(self, word : str) -> bool:
-		return search(self.nfa, word)
+		#words lacking the literal prefix or suffix are rejected by C level compares
+		if not (word.startswith(self.prefix) and word.endswith(self.suffix)) :
+			return False
+		
+		try :
+			data = word.encode('latin-1')
+		except UnicodeEncodeError:
+			return self.dfa.match(map(ord, word))
+		
+		#bytes.translate drops every char of the alphabet in one C pass,
+		#anything left over is a char the pattern never accepts
+		if data.translate(None, self.alphabet) :
+			return False
+		
+		if self.table is not None :
+			return self.table.match(data)
+		
+		return self.dfa.match(data)
+
+#compiled patterns are shared, matching never changes what a Regex accepts
+
+@functools.lru_cache(maxsize = 512)
+def compile(expr : str) -> Regex :
+	return Regex(expr)
 
+def purge() :
+	#drop every cached pattern, as re.purge does
+	compile.cache_clear()
@@ -0,0 +1,208 @@
+import io
+import re
+import sys
+import copy
+import pickle
+import random
+import unittest
+import threading
+import contextlib
+
+import regeng
+
+class RegexTest(unittest.TestCase) :
+	def assertMatches(self, pattern : str, accepted : list, rejected : list) :
+		r = regeng.Regex(pattern)
+		
+		for word in accepted :
+			self.assertTrue(r.match(word), (pattern, word))
+		
+		for word in rejected :
+			self.assertFalse(r.match(word), (pattern, word))
+	
+	def assertInvalid(self, pattern : str) :
+		#invalid patterns are reported on stderr and exit with 64
+		with contextlib.redirect_stderr(io.StringIO()) as err :
+			with self.assertRaises(SystemExit) as ctx :
+				regeng.Regex(pattern)
+		
+		self.assertEqual(ctx.exception.code, 64)
+		self.assertEqual(err.getvalue(), "Invalid regex pattern.\n")
+
+class ParserTest(RegexTest) :
+	def testPrecedence(self) :
+		#repeat binds tighter than concat, which binds tighter than union
+		self.assertMatches('ab*|c', ['a', 'abbb', 'c'], ['', 'ab*', 'abc', 'cc'])
+		self.assertMatches('(ab)*|c', ['', 'abab', 'c'], ['a', 'abc'])
+		self.assertMatches('a(b|c)+d?', ['ab', 'acbd'], ['a', 'ad', 'abdd'])
+	
+	def testEmptyBranches(self) :
+		self.assertMatches('a|', ['a', ''], ['aa'])
+		self.assertMatches('a()b', ['ab'], ['a', 'a()b'])
+		self.assertMatches('', [''], ['a'])
+	
+	def testDeepNesting(self) :
+		#nesting is not bound by the recursion limit
+		self.assertMatches('(' * 2000 + 'a' + ')' * 2000, ['a'], ['', 'aa'])
+		self.assertMatches('(' * 300 + 'ab|c' + ')*' * 300, ['', 'abcab'], ['abb'])
+		self.assertInvalid('(' * 2000 + 'a' + ')' * 1999)
+	
+	def testClassesAndEscapes(self) :
+		self.assertMatches('[a-c_]\\d', ['a0', '_9'], ['d0', 'a', 'aa'])
+		self.assertMatches('\\w+\\s\\w+', ['ab cd', 'x\ty'], ['ab  cd', 'ab'])
+		self.assertMatches('a\\*\\(', ['a*('], ['a', 'aa('])
+	
+	def testDot(self) :
+		#a literal dot is escaped, a bare one is rejected
+		self.assertMatches('a\\.b', ['a.b'], ['axb', 'ab'])
+		self.assertMatches('[.]', ['.'], ['a'])
+		self.assertInvalid('a.b')
+	
+	def testInvalidPatterns(self) :
+		for pattern in ['(a', 'a)', ')(', '(a|b', '*a', 'a|+', 'a\\', '[ab', '[z-a]', '[a-\\d]'] :
+			with self.subTest(pattern = pattern) :
+				self.assertInvalid(pattern)
+
+class EngineTest(RegexTest) :
+	def testLiteralAffixes(self) :
+		#(pattern, literal prefix, literal suffix)
+		cases = [
+			('a*b', '', 'b'),
+			('(ab)+', 'ab', 'ab'),
+			('xa|ya', '', 'a'),
+			('a|ba', '', 'a'),
+			('a\\*', 'a*', 'a*'),
+			('abc(d|e)xy', 'abc', 'xy'),
+			('a', 'a', 'a'),
+			('aa?', 'a', 'a'),
+			('', '', '')
+		]
+		
+		for pattern, prefix, suffix in cases :
+			r = regeng.Regex(pattern)
+			self.assertEqual((r.prefix, r.suffix), (prefix, suffix), pattern)
+		
+		#the prefix and the suffix may overlap in a match
+		self.assertMatches('a', ['a'], ['', 'aa'])
+		self.assertMatches('aa?', ['a', 'aa'], ['', 'aaa'])
+		self.assertMatches('(ab)+', ['ab', 'abab'], ['', 'aba', 'abb'])
+		self.assertMatches('a|ba', ['a', 'ba'], ['', 'b', 'aa'])
+	
+	def testAlphabet(self) :
+		#words outside latin-1 skip the table for the LazyDFA
+		self.assertMatches('[a-\u0101]+', ['a\u0101', '\u0101', '\u00e9a'], ['', 'a\u0102'])
+		self.assertMatches('\u0101', ['\u0101'], ['a', '', '\u0101\u0101'])
+		
+		#a char no transition accepts rejects the word up front
+		r = regeng.Regex('(a|b)*c')
+		self.assertEqual(r.alphabet, b'abc')
+		self.assertMatches('(a|b)*c', ['abc', 'c'], ['abdc', 'ab\u00e9c', 'ab\u0101c', 'ab'])
+	
+	def testMinimalTable(self) :
+		#(pattern, states of the minimal DFA, counting the dead state)
+		cases = [
+			('ab|cb', 4),
+			('ab*|cb*', 3),
+			('(a|b)(a|b)(a|b)|c(a|b)(a|b)', 5),
+			('(a|b)*abb', 5)
+		]
+		
+		for pattern, size in cases :
+			table = regeng.Regex(pattern).table
+			self.assertEqual(len(table.trans), size, pattern)
+			
+			#the dead state still rejects and no byte leaves it
+			dead = table.dead
+			self.assertNotEqual(dead, table.start, pattern)
+			self.assertEqual(table.accept[dead], 0, pattern)
+			self.assertEqual(set(table.trans[dead]), {dead}, pattern)
+		
+		#a pattern taking every byte anywhere has no dead state
+		table = regeng.Regex('[\x00-\xff]*').table
+		self.assertEqual((len(table.trans), table.dead), (1, -1))
+		self.assertMatches('ab*|cb*', ['a', 'abb', 'cb'], ['', 'b', 'ac', 'abc'])
+	
+	def testTableLimit(self) :
+		#a DFA over MaxTableStates is left to the LazyDFA
+		pattern = '(a|b)*a' + '(a|b)' * 11
+		r = regeng.Regex(pattern)
+		self.assertIsNone(r.table)
+		self.assertMatches(pattern, ['a' + 'b' * 11, 'ab' * 6, 'bb' + 'a' * 12], ['b' * 12, 'a' * 11, 'a' + 'b' * 12])
+		
+		#so is an NFA over it, without trying the subset construction
+		r = regeng.Regex('a' * 3000)
+		self.assertGreater(r.flat.numStates, regeng.MaxTableStates)
+		self.assertIsNone(r.table)
+		self.assertTrue(r.match('a' * 3000))
+		self.assertFalse(r.match('a' * 2999))
+
+class SharingTest(RegexTest) :
+	Pattern = '(a|b)*a' + '(a|b)' * 13 #no table DFA, matching fills the LazyDFA
+	
+	def testLazyFlush(self) :
+		#a cache of two states is flushed on almost every step
+		sim = regeng.BitNFA(regeng.FlatNFA(regeng.parse('(a|b)*abb')))
+		dfa = regeng.LazyDFA(sim, maxStates = 2)
+		
+		for word, result in [('abb', True), ('babb', True), ('ab', False), ('abba', False), ('', False), ('aabbabb', True)] :
+			self.assertEqual(dfa.match(regeng.toCodes(word)), result, word)
+			self.assertLessEqual(len(dfa.cache[2]), 4)
+	
+	def testThreads(self) :
+		#threads share one compiled pattern whose LazyDFA keeps flushing
+		r = regeng.Regex(self.Pattern)
+		r.dfa = regeng.LazyDFA(r.dfa.nfa, maxStates = 16)
+		expected = re.compile(self.Pattern)
+		errors = []
+		
+		def work(seed : int) :
+			rnd = random.Random(seed)
+			
+			for _ in range(100) :
+				word = ''.join(rnd.choice('ab') for _ in range(rnd.randint(10, 40)))
+				
+				try :
+					if r.match(word) != (expected.fullmatch(word) is not None) :
+						errors.append(word)
+				except Exception as e :
+					errors.append(e)
+		
+		interval = sys.getswitchinterval()
+		sys.setswitchinterval(1e-6)
+		
+		try :
+			threads = [threading.Thread(target = work, args = (seed,)) for seed in range(8)]
+			
+			for thread in threads :
+				thread.start()
+			
+			for thread in threads :
+				thread.join()
+		
+		finally :
+			sys.setswitchinterval(interval)
+		
+		self.assertEqual(errors, [])
+	
+	def testCompileCache(self) :
+		regeng.purge()
+		r = regeng.compile('(a|b)*c')
+		self.assertIs(regeng.compile('(a|b)*c'), r)
+		self.assertIs(regeng.Regex('(a|b)*c', cache = True), r)
+		self.assertIsNot(regeng.Regex('(a|b)*c'), r)
+		self.assertEqual(regeng.Regex('(a|b)*c'), r)
+		
+		regeng.purge()
+		self.assertIsNot(regeng.compile('(a|b)*c'), r)
+	
+	def testCopyAndPickle(self) :
+		words = ['', 'c', 'abac', 'abca', 'a\u0101c']
+		
+		for r in [regeng.Regex('(a|b)*c'), regeng.compile('(a|b)*c'), regeng.Regex(self.Pattern)] :
+			for clone in [copy.copy(r), copy.deepcopy(r), pickle.loads(pickle.dumps(r))] :
+				self.assertIsInstance(clone, regeng.Regex)
+				self.assertEqual(clone, r)
+				self.assertEqual([clone.match(word) for word in words], [r.match(word) for word in words])
+
+if __name__ == "__main__" :
+	unittest.main()